@@ -1,53 +1,133 @@
+import asyncio
+import hashlib
+import re
+import time
+import weakref
+
 import httpx
 from fastmcp.server.auth import AccessToken, TokenVerifier
 from fastmcp.server.auth.oauth_proxy import OAuthProxy
 
+# How long a successful userinfo verification stays cached. Kept well under
+# typical access-token lifetimes so revocation is picked up quickly.
+_VERIFY_CACHE_TTL_SECONDS = 60.0
+
+# Matches the ID segment of a "Patient/{id}" reference, with or without a
+# trailing path, query, or fragment.
+_PATIENT_RE = re.compile(r"Patient/([^/?#]+)")
+
 
 class BlueButtonTokenVerifier(TokenVerifier):
     """
     Token verifier for Blue Button API.
     Validates tokens by calling the userinfo endpoint.
+
+    Successful verifications are cached briefly so a burst of tool calls
+    with the same bearer token costs one userinfo round-trip rather than
+    one per call. Cache keys are token digests; raw tokens are never stored,
+    and cached claims are limited to non-PHI fields.
     """
 
     def __init__(self, api_base: str, base_url: str | None = None):
         super().__init__(base_url=base_url)
         self.api_base = api_base
+        # Long-lived client so userinfo checks reuse keep-alive connections
+        # instead of opening a fresh TLS session on every request.
+        self._client = httpx.AsyncClient(
+            base_url=api_base,
+            http2=True,
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=10),
+        )
+        self._cache: dict[str, tuple[float, AccessToken]] = {}
+        self._cache_lock = asyncio.Lock()
+        # Interned tokens outlive the TTL cache for as long as requests hold
+        # them, so a re-verification of the same bearer reuses the existing
+        # immutable instance instead of allocating a duplicate.
+        self._intern: weakref.WeakValueDictionary[str, AccessToken] = weakref.WeakValueDictionary()
+
+    async def aclose(self) -> None:
+        """Close the verifier's HTTP client. Called on server shutdown."""
+        await self._client.aclose()
+
+    async def __aenter__(self) -> "BlueButtonTokenVerifier":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
 
     async def verify_token(self, token: str) -> AccessToken | None:
         """
         Validate the access token by making a request to Blue Button API.
         Returns AccessToken with claims about the authenticated user.
         """
+        cache_key = hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+        now = time.monotonic()
+
+        async with self._cache_lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                expires, access_token = cached
+                if now < expires:
+                    return access_token
+                del self._cache[cache_key]
+
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.api_base}/connect/userinfo",
-                    headers={"Authorization": f"Bearer {token}"},
-                )
-                response.raise_for_status()
-                claims = response.json()
+            response = await self._client.get(
+                "connect/userinfo",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            response.raise_for_status()
+            claims = response.json()
 
             # Extract patient ID from token claims
             patient_id = self._extract_patient_id(claims)
-            if patient_id:
-                claims["patient"] = patient_id
 
             # Extract scopes
             scopes = self._extract_scopes(claims)
 
-            return AccessToken(
-                token=token,
-                client_id=claims.get("sub", "unknown"),
-                scopes=scopes,
-                expires_at=None,
-                claims=claims,
-            )
+            # Keep only non-PHI fields; the full userinfo payload may
+            # contain demographics and must not sit in the cache.
+            slim_claims = {
+                "sub": claims.get("sub"),
+                "patient": patient_id,
+                "scope": claims.get("scope"),
+            }
+
+            interned = self._intern.get(cache_key)
+            if (
+                interned is not None
+                and interned.claims == slim_claims
+                and interned.scopes == scopes
+            ):
+                access_token = interned
+            else:
+                access_token = AccessToken(
+                    token=token,
+                    client_id=claims.get("sub", "unknown"),
+                    scopes=scopes,
+                    expires_at=None,
+                    claims=slim_claims,
+                )
+                self._intern[cache_key] = access_token
+
+            async with self._cache_lock:
+                self._evict_expired(now)
+                self._cache[cache_key] = (now + _VERIFY_CACHE_TTL_SECONDS, access_token)
+
+            return access_token
 
         except httpx.HTTPStatusError:
             return None
         except Exception:
             return None
 
+    def _evict_expired(self, now: float) -> None:
+        """Drop expired cache entries. Caller must hold the cache lock."""
+        expired = [key for key, (expires, _) in self._cache.items() if expires <= now]
+        for key in expired:
+            del self._cache[key]
+
     def _extract_patient_id(self, claims: dict) -> str | None:
         """Extract patient ID from various possible claim formats."""
         # Direct patient claim
@@ -56,10 +136,9 @@ class BlueButtonTokenVerifier(TokenVerifier):
 
         # fhir_user claim (format: "Patient/{id}" or full URL)
         if "fhir_user" in claims:
-            fhir_user = claims["fhir_user"]
-            if "Patient/" in fhir_user:
-                patient_id = fhir_user.split("Patient/")[-1]
-                return patient_id.split("/")[0].split("?")[0]
+            match = _PATIENT_RE.search(claims["fhir_user"])
+            if match:
+                return match.group(1)
 
         # sub claim as fallback
         if "sub" in claims and claims["sub"].startswith("Patient/"):
@@ -78,6 +157,16 @@ class BlueButtonTokenVerifier(TokenVerifier):
         return []
 
 
+# The verifier created by create_oauth_provider, kept so the server lifespan
+# can close its HTTP client on shutdown.
+_token_verifier: BlueButtonTokenVerifier | None = None
+
+
+def get_token_verifier() -> BlueButtonTokenVerifier | None:
+    """Return the active token verifier, if one has been created."""
+    return _token_verifier
+
+
 def create_oauth_provider(
     client_id: str,
     client_secret: str,
@@ -91,7 +180,9 @@ def create_oauth_provider(
     so we use OAuthProxy to bridge between MCP's DCR expectations
     and Blue Button's fixed OAuth flow.
     """
+    global _token_verifier
     token_verifier = BlueButtonTokenVerifier(api_base=api_base, base_url=base_url)
+    _token_verifier = token_verifier
 
     return OAuthProxy(
         upstream_client_id=client_id,
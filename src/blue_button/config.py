@@ -8,3 +8,13 @@ load_dotenv()
 
 # Blue Button API base URL - defaults to sandbox for development
 API_BASE = os.environ.get("BLUE_BUTTON_API_BASE", "https://sandbox.bluebutton.cms.gov/v2")
+
+# FHIR endpoint templates, relative to API_BASE, bound once at import so the
+# paths live in a single place.
+ENDPOINTS = {
+    "patient": "fhir/Patient/{pid}",
+    "coverage": "fhir/Coverage?beneficiary={pid}",
+    "eob_all": "fhir/ExplanationOfBenefit?patient={pid}",
+    "eob_one": "fhir/ExplanationOfBenefit/{eid}",
+    "eob_search": "fhir/ExplanationOfBenefit",
+}
@@ -6,15 +6,39 @@ Uses the CMS Blue Button 2.0 API (https://bluebutton.cms.gov/) to retrieve
 FHIR-formatted patient, coverage, and claims data.
 """
 
+import asyncio
 import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
 from fastmcp import FastMCP
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 
-from src.blue_button.auth import create_oauth_provider
+from src.blue_button.auth import create_oauth_provider, get_token_verifier
 from src.blue_button.config import API_BASE
 from src.blue_button.tools import register_tools
+from src.blue_button.utils import close_http_client, get_http_client
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Own the shared HTTP clients: open them at startup, close them at shutdown."""
+    client = get_http_client()
+    # Pre-establish the pooled TLS connection so the first tool call doesn't
+    # pay the handshake while a user is waiting. Any response (even 4xx) means
+    # the connection is warm; failures here are harmless.
+    try:
+        await asyncio.wait_for(client.head("/"), timeout=5)
+    except Exception:
+        pass
+    try:
+        yield
+    finally:
+        await close_http_client()
+        verifier = get_token_verifier()
+        if verifier is not None:
+            await verifier.aclose()
 
 
 def create_server() -> FastMCP:
@@ -35,7 +59,7 @@ def create_server() -> FastMCP:
         api_base=API_BASE,
     )
 
-    mcp = FastMCP(name="Blue Button Medicare Data", auth=auth)
+    mcp = FastMCP(name="Blue Button Medicare Data", auth=auth, lifespan=lifespan)
 
     register_tools(mcp)
 
@@ -1,46 +1,55 @@
+import asyncio
+
 import httpx
 
-from src.blue_button.utils import call_api, get_patient_id_from_token
+from src.blue_button.config import ENDPOINTS
+from src.blue_button.utils import (
+    call_api,
+    call_api_summary,
+    fetch_all_pages,
+    mcp_tool_errors,
+    require_patient,
+)
+
+
+def _result_or_error(result) -> dict:
+    """Normalize a gather() result, mapping exceptions to error dicts."""
+    if isinstance(result, httpx.HTTPStatusError):
+        return {"error": f"API error: {result.response.status_code}", "detail": str(result)}
+    if isinstance(result, Exception):
+        return {"error": f"{type(result).__name__}: {result}"}
+    return result
 
 
 def register_tools(mcp):
     @mcp.tool()
+    @mcp_tool_errors
     async def get_patient_info() -> dict:
         """
         Get patient demographic and personal information.
         Returns FHIR Patient resource with name, address, birth date, etc.
         Requires patient/Patient.rs scope.
         """
-        result = get_patient_id_from_token()
-        if result[0] is None:
-            return result[1]
-        token, patient_id = result
+        token, patient_id = require_patient()
 
-        try:
-            data = await call_api(token.token, f"fhir/Patient/{patient_id}")
-            return {"patient_id": patient_id, "data": data}
-        except httpx.HTTPStatusError as e:
-            return {"error": f"API error: {e.response.status_code}", "detail": str(e)}
+        data = await call_api(token.token, ENDPOINTS["patient"].format(pid=patient_id))
+        return {"patient_id": patient_id, "data": data}
 
     @mcp.tool()
+    @mcp_tool_errors
     async def get_coverage_info() -> dict:
         """
         Get Medicare and supplemental coverage information.
         Returns FHIR Coverage resources showing insurance plans and periods.
         Requires patient/Coverage.rs scope.
         """
-        result = get_patient_id_from_token()
-        if result[0] is None:
-            return result[1]
-        token, patient_id = result
+        token, patient_id = require_patient()
 
-        try:
-            data = await call_api(token.token, f"fhir/Coverage?beneficiary={patient_id}")
-            return {"patient_id": patient_id, "coverage": data}
-        except httpx.HTTPStatusError as e:
-            return {"error": f"API error: {e.response.status_code}", "detail": str(e)}
+        data = await call_api(token.token, ENDPOINTS["coverage"].format(pid=patient_id))
+        return {"patient_id": patient_id, "coverage": data}
 
     @mcp.tool()
+    @mcp_tool_errors
     async def get_explanation_of_benefit(eob_id: str | None = None) -> dict:
         """
         Get Medicare claim information (Explanation of Benefit records).
@@ -50,23 +59,64 @@ def register_tools(mcp):
         Args:
             eob_id: Optional specific EOB ID. If not provided, returns all EOBs.
         """
-        result = get_patient_id_from_token()
-        if result[0] is None:
-            return result[1]
-        token, patient_id = result
-
-        try:
-            if eob_id:
-                endpoint = f"fhir/ExplanationOfBenefit/{eob_id}"
-            else:
-                endpoint = f"fhir/ExplanationOfBenefit?patient={patient_id}"
-
-            data = await call_api(token.token, endpoint)
-            return {"patient_id": patient_id, "claims": data}
-        except httpx.HTTPStatusError as e:
-            return {"error": f"API error: {e.response.status_code}", "detail": str(e)}
+        token, patient_id = require_patient()
+
+        if eob_id:
+            data = await call_api(token.token, ENDPOINTS["eob_one"].format(eid=eob_id))
+        else:
+            data = await fetch_all_pages(token.token, ENDPOINTS["eob_all"].format(pid=patient_id))
+        return {"patient_id": patient_id, "claims": data}
+
+    @mcp.tool()
+    @mcp_tool_errors
+    async def get_patient_bundle() -> dict:
+        """
+        Get patient demographics, coverage, and claims in a single call.
+        Issues the three FHIR reads concurrently over the shared connection
+        pool, so the combined fetch costs roughly one round-trip.
+        Requires patient/Patient.rs, patient/Coverage.rs, and
+        patient/ExplanationOfBenefit.rs scopes.
+        """
+        token, patient_id = require_patient()
+
+        patient, coverage, eobs = await asyncio.gather(
+            call_api(token.token, ENDPOINTS["patient"].format(pid=patient_id)),
+            call_api(token.token, ENDPOINTS["coverage"].format(pid=patient_id)),
+            fetch_all_pages(token.token, ENDPOINTS["eob_all"].format(pid=patient_id)),
+            return_exceptions=True,
+        )
+        return {
+            "patient_id": patient_id,
+            "patient": _result_or_error(patient),
+            "coverage": _result_or_error(coverage),
+            "claims": _result_or_error(eobs),
+        }
+
+    @mcp.tool()
+    @mcp_tool_errors
+    async def get_claims_summary(claim_type: str | None = None) -> dict:
+        """
+        Get a lightweight summary of claims: the total count plus each
+        claim's ID and billable period. Streams all Bundle pages instead of
+        materializing them, so it stays cheap even for large claim
+        histories; "truncated" is true if the history exceeded the page cap.
+        Requires patient/ExplanationOfBenefit.rs scope.
+
+        Args:
+            claim_type: Optional type of claim (carrier, inpatient, outpatient,
+                snf, hospice, hha, dme, pde)
+        """
+        token, patient_id = require_patient()
+
+        params = {"patient": patient_id}
+        if claim_type:
+            params["type"] = claim_type
+
+        summary = await call_api_summary(token.token, ENDPOINTS["eob_search"], params=params)
+        return {"patient_id": patient_id, "claim_type": claim_type, **summary}
 
     @mcp.tool()
+    @mcp_tool_errors
     async def search_claims(
         service_date_start: str | None = None,
         service_date_end: str | None = None,
@@ -80,29 +130,27 @@ def register_tools(mcp):
             service_date_end: Filter claims to this date (YYYY-MM-DD)
             claim_type: Type of claim (carrier, inpatient, outpatient, snf, hospice, hha, dme, pde)
         """
-        result = get_patient_id_from_token()
-        if result[0] is None:
-            return result[1]
-        token, patient_id = result
-
-        params = [f"patient={patient_id}"]
-        if service_date_start:
-            params.append(f"service-date=ge{service_date_start}")
-        if service_date_end:
-            params.append(f"service-date=le{service_date_end}")
-        if claim_type:
-            params.append(f"type={claim_type}")
-
-        try:
-            data = await call_api(token.token, f"fhir/ExplanationOfBenefit?{'&'.join(params)}")
-            return {
-                "patient_id": patient_id,
-                "filters": {
-                    "service_date_start": service_date_start,
-                    "service_date_end": service_date_end,
-                    "claim_type": claim_type,
-                },
-                "results": data,
-            }
-        except httpx.HTTPStatusError as e:
-            return {"error": f"API error: {e.response.status_code}", "detail": str(e)}
+        token, patient_id = require_patient()
+
+        service_date = [
+            f"ge{service_date_start}" if service_date_start else None,
+            f"le{service_date_end}" if service_date_end else None,
+        ]
+        params = {
+            "patient": patient_id,
+            "service-date": [v for v in service_date if v] or None,
+            "type": claim_type,
+        }
+        # httpx URL-escapes the values; drop unused filters entirely.
+        params = {key: value for key, value in params.items() if value is not None}
+
+        data = await fetch_all_pages(token.token, ENDPOINTS["eob_search"], params=params)
+        return {
+            "patient_id": patient_id,
+            "filters": {
+                "service_date_start": service_date_start,
+                "service_date_end": service_date_end,
+                "claim_type": claim_type,
+            },
+            "results": data,
+        }
@@ -1,6 +1,14 @@
+import asyncio
+import functools
+import hashlib
 import logging
+import time
+import urllib.parse
 
 import httpx
+import ijson
+import orjson
+import zstandard
 from fastmcp.server.auth import AccessToken
 from fastmcp.server.dependencies import get_access_token
 
@@ -10,48 +18,340 @@ from src.blue_button.config import API_BASE
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared HTTP client reused across all tool calls so FHIR requests ride
+# keep-alive connections instead of paying a TCP+TLS handshake per request.
+# Created lazily on first use and closed by the server lifespan on shutdown.
+_http_client: httpx.AsyncClient | None = None
 
-async def call_api(token: str, endpoint: str) -> dict:
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=API_BASE,
+            timeout=30.0,
+            headers={"Accept": "application/fhir+json"},
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=3,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client. Called from the server lifespan on shutdown."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+# Short-TTL in-process cache of FHIR responses, so repeated agent queries in a
+# session skip the upstream round-trip. Entries hold the zstd-compressed JSON
+# bytes (typical Bundles shrink close to an order of magnitude), keyed by a
+# digest of token+endpoint+params so patients never share entries. The cache
+# lives only in process memory and is never persisted.
+_RESPONSE_CACHE_TTL_SECONDS = 60.0
+_response_cache: dict[str, tuple[float, bytes]] = {}
+_response_cache_lock = asyncio.Lock()
+_zstd_compressor = zstandard.ZstdCompressor(level=3)
+_zstd_decompressor = zstandard.ZstdDecompressor()
+
+
+def _response_cache_key(token: str, endpoint: str, params: dict | None) -> str:
+    """Digest the request identity; the raw token is never stored."""
+    material = orjson.dumps([token, endpoint, params])
+    return hashlib.blake2b(material, digest_size=16).hexdigest()
+
+
+def _evict_expired_responses(now: float) -> None:
+    """Drop expired cache entries. Caller must hold the cache lock."""
+    expired = [key for key, (expires, _) in _response_cache.items() if expires <= now]
+    for key in expired:
+        del _response_cache[key]
+
+
+# Transient upstream statuses retried inside call_api, so the agent doesn't
+# pay a fresh MCP round-trip just to try again.
+_RETRY_STATUSES = (429, 503)
+_MAX_STATUS_RETRIES = 2
+_MAX_RETRY_DELAY_SECONDS = 2.0
+
+
+def _retry_delay(response: httpx.Response) -> float:
+    """Honor a numeric Retry-After header, capped at the maximum delay."""
+    try:
+        delay = float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        delay = _MAX_RETRY_DELAY_SECONDS
+    return min(max(delay, 0.0), _MAX_RETRY_DELAY_SECONDS)
+
+
+async def call_api(token: str, endpoint: str, params: dict | None = None) -> dict:
     """Make authenticated request to Blue Button FHIR API."""
-    url = f"{API_BASE}/{endpoint}"
-    logger.debug(f"Making request to: {url}")
+    logger.debug("Making request to: %s/%s", API_BASE, endpoint)
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
+    cache_key = _response_cache_key(token, endpoint, params)
+    now = time.monotonic()
+    async with _response_cache_lock:
+        cached = _response_cache.get(cache_key)
+        if cached is not None:
+            expires, blob = cached
+            if now < expires:
+                return orjson.loads(_zstd_decompressor.decompress(blob))
+            del _response_cache[cache_key]
+
+    client = get_http_client()
+    try:
+        for attempt in range(_MAX_STATUS_RETRIES + 1):
             response = await client.get(
-                url,
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Accept": "application/fhir+json",
-                },
+                endpoint,
+                params=params,
+                headers={"Authorization": f"Bearer {token}"},
             )
-            logger.debug(f"Response status: {response.status_code}")
+            logger.debug("Response status: %s", response.status_code)
+            if response.status_code in _RETRY_STATUSES and attempt < _MAX_STATUS_RETRIES:
+                delay = _retry_delay(response)
+                logger.warning(
+                    "Transient %s from upstream; retrying in %.1fs",
+                    response.status_code,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+                continue
             response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error: {e.response.status_code}")
-            logger.error(f"Response body: {e.response.text}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error: {type(e).__name__}: {e}")
-            raise
+            now = time.monotonic()
+            async with _response_cache_lock:
+                _evict_expired_responses(now)
+                _response_cache[cache_key] = (
+                    now + _RESPONSE_CACHE_TTL_SECONDS,
+                    _zstd_compressor.compress(response.content),
+                )
+            # orjson decodes large FHIR Bundles several times faster than stdlib json.
+            return orjson.loads(response.content)
+    except httpx.HTTPStatusError as e:
+        logger.error("HTTP error: %s", e.response.status_code)
+        logger.error("Response body: %s", e.response.text)
+        raise
+    except Exception as e:
+        logger.error("Unexpected error: %s: %s", type(e).__name__, e)
+        raise
+
+
+@ijson.coroutine
+def _bundle_summary_collector(page: dict):
+    """Collect Bundle total, per-entry summary fields, and the "next" link."""
+    current = None
+    link = None
+    while True:
+        prefix, event, value = yield
+        if prefix == "total":
+            page["total"] = value
+        elif prefix == "entry.item" and event == "start_map":
+            current = {}
+        elif prefix == "entry.item" and event == "end_map":
+            page["entries"].append(current)
+            current = None
+        elif current is not None:
+            if prefix == "entry.item.resource.id":
+                current["id"] = value
+            elif prefix == "entry.item.resource.billablePeriod.start":
+                current["billable_period_start"] = value
+            elif prefix == "entry.item.resource.billablePeriod.end":
+                current["billable_period_end"] = value
+        elif prefix == "link.item" and event == "start_map":
+            link = {}
+        elif prefix == "link.item" and event == "end_map":
+            if link.get("relation") == "next":
+                page["next_url"] = link.get("url")
+            link = None
+        elif link is not None:
+            if prefix == "link.item.relation":
+                link["relation"] = value
+            elif prefix == "link.item.url":
+                link["url"] = value
+
+
+async def _stream_summary_page(token: str, endpoint: str, params: dict | None) -> dict:
+    """Stream one Bundle page, collecting summary fields and its next link."""
+    page: dict = {"total": None, "entries": [], "next_url": None}
+    target = ijson.parse_coro(_bundle_summary_collector(page))
+
+    client = get_http_client()
+    async with client.stream(
+        "GET",
+        endpoint,
+        params=params,
+        headers={"Authorization": f"Bearer {token}"},
+    ) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            target.send(chunk)
+    target.close()
+    return page
+
+
+async def call_api_summary(
+    token: str, endpoint: str, params: dict | None = None, max_pages: int = 20
+) -> dict:
+    """
+    Stream a FHIR Bundle and extract only its total and per-entry summary
+    fields (resource id, billable period) without materializing the full
+    response, which for large claim sets avoids allocating one object per
+    JSON node. Follows pagination links so the summary covers every entry;
+    if the result set exceeds max_pages, "truncated" is set to True.
+    """
+    first = await _stream_summary_page(token, endpoint, params)
+    entries = first["entries"]
+    next_url = first["next_url"]
+    pages_fetched = 1
+    while next_url and pages_fetched < max_pages:
+        page = await _stream_summary_page(token, next_url, None)
+        entries.extend(page["entries"])
+        next_url = page["next_url"]
+        pages_fetched += 1
+
+    return {"total": first["total"], "entries": entries, "truncated": bool(next_url)}
 
 
-def get_patient_id_from_token() -> tuple[AccessToken, str] | tuple[None, dict]:
-    """Get the access token and patient ID."""
+# Cap on concurrent page fetches when paginating a Bundle.
+_PAGE_FETCH_CONCURRENCY = 8
+
+
+def _next_link(bundle: dict) -> str | None:
+    """Return the URL of the Bundle's "next" pagination link, if any."""
+    for link in bundle.get("link", []):
+        if link.get("relation") == "next":
+            return link.get("url")
+    return None
+
+
+def _remaining_page_urls(bundle: dict) -> list[str] | None:
+    """
+    Derive the URLs of all remaining pages from a Bundle's "next" and "last"
+    links. Blue Button paginates with startIndex/_count query parameters, so
+    once the first page is in hand every other page URL is known. Returns
+    None when the links don't follow that scheme.
+    """
+    links = {link.get("relation"): link.get("url") for link in bundle.get("link", [])}
+    next_url = links.get("next")
+    last_url = links.get("last")
+    if not next_url or not last_url:
+        return None
+
+    parsed = urllib.parse.urlsplit(next_url)
+    query = urllib.parse.parse_qs(parsed.query)
+    try:
+        start = int(query["startIndex"][0])
+        count = int(query["_count"][0])
+        last_query = urllib.parse.parse_qs(urllib.parse.urlsplit(last_url).query)
+        last_start = int(last_query["startIndex"][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+    if count <= 0:
+        return None
+
+    urls = []
+    for index in range(start, last_start + 1, count):
+        query["startIndex"] = [str(index)]
+        urls.append(parsed._replace(query=urllib.parse.urlencode(query, doseq=True)).geturl())
+    return urls
+
+
+async def fetch_all_pages(
+    token: str, endpoint: str, params: dict | None = None, max_pages: int = 20
+) -> dict:
+    """
+    Fetch a FHIR Bundle and follow its pagination, returning the first page
+    with the entries of all pages concatenated.
+
+    When the remaining page URLs can be derived from the first page's links,
+    they are fetched concurrently (bounded by a semaphore) over the shared
+    connection pool; otherwise the "next" links are walked serially.
+
+    If the result set exceeds max_pages, the returned Bundle keeps a "next"
+    link pointing at the first unfetched page so the truncation is visible.
+    """
+    first = await call_api(token, endpoint, params=params)
+    if _next_link(first) is None:
+        return first
+
+    entries = list(first.get("entry", []))
+    # URL of the first unfetched page when the page cap is hit.
+    next_url: str | None = None
+    page_urls = _remaining_page_urls(first)
+    if page_urls is not None:
+        unfetched = page_urls[max_pages - 1 :]
+        page_urls = page_urls[: max_pages - 1]
+        semaphore = asyncio.Semaphore(_PAGE_FETCH_CONCURRENCY)
+
+        async def fetch_page(url: str) -> dict:
+            async with semaphore:
+                return await call_api(token, url)
+
+        pages = await asyncio.gather(*(fetch_page(url) for url in page_urls))
+        for page in pages:
+            entries.extend(page.get("entry", []))
+        if unfetched:
+            next_url = unfetched[0]
+    else:
+        next_url = _next_link(first)
+        pages_fetched = 1
+        while next_url and pages_fetched < max_pages:
+            page = await call_api(token, next_url)
+            entries.extend(page.get("entry", []))
+            next_url = _next_link(page)
+            pages_fetched += 1
+
+    first["entry"] = entries
+    # Per-page pagination links no longer describe the combined result, but a
+    # "next" link is preserved whenever pages remain unfetched.
+    links = [link for link in first.get("link", []) if link.get("relation") in ("self", "first")]
+    if next_url:
+        links.append({"relation": "next", "url": next_url})
+    first["link"] = links
+    return first
+
+
+class AuthError(Exception):
+    """Raised when a tool is called without a usable authenticated patient."""
+
+
+def require_patient() -> tuple[AccessToken, str]:
+    """Get the access token and patient ID, raising AuthError when absent."""
     token = get_access_token()
-    logger.debug(f"Token retrieved: {token is not None}")
 
     if not token:
         logger.error("No access token available")
-        return None, {"error": "Not authenticated"}
-
-    logger.debug(f"Token claims: {token.claims}")
+        raise AuthError("Not authenticated")
 
-    patient_id = token.claims.get("patient")
+    # The patient ID is parsed once at token-verification time, so this is
+    # a plain attribute read with no fallback chain.
+    patient_id = token.claims["patient"]
     if not patient_id:
-        logger.error(f"No patient ID in token claims: {token.claims.keys()}")
-        return None, {"error": "No patient ID in token"}
+        logger.error("No patient ID in token")
+        raise AuthError("No patient ID in token")
 
-    logger.debug(f"Patient ID: {patient_id}")
     return token, patient_id
+
+
+def mcp_tool_errors(fn):
+    """
+    Map errors raised in a tool body to the error-dict responses tools
+    return: AuthError for missing auth, httpx.HTTPStatusError for upstream
+    API failures. Keeps the tool bodies to their happy path.
+    """
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await fn(*args, **kwargs)
+        except AuthError as e:
+            return {"error": str(e)}
+        except httpx.HTTPStatusError as e:
+            return {"error": f"API error: {e.response.status_code}", "detail": str(e)}
+
+    return wrapper